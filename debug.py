@@ -28,173 +28,262 @@ Usage:
   python debug.py -o output.json  # writes pretty JSON array to file
   python debug.py --ndjson        # prints newline-delimited JSON entries
   python debug.py -i path/to.log  # specify a different input file
+  python debug.py --async-write   # overlap output writes with parsing
+  python debug.py -j 0            # parse with one worker process per CPU
+
+If orjson is installed it is used for JSON decoding/encoding; otherwise the
+stdlib json module is used and output is unchanged. Without orjson, payloads
+are decoded with pysimdjson when that is installed. Likewise google-re2 is
+used for line matching when installed (linear-time, no backtracking), with
+the stdlib re module as the fallback.
+
+Line parsing lives in debug_core.py. The CLI-only imports below (argparse,
+the process pool, the writer thread) are deferred to where they are used,
+because spawn/forkserver --jobs workers re-run this module on start-up.
+Both modules are fully type-annotated and compile with
+mypyc for a faster per-line dispatch:
+  mypyc debug_core.py debug.py
+  python -c "import debug; raise SystemExit(debug.main())" -i debug.log
 """
 
 from __future__ import annotations
 
-import argparse
-import json
-import re
+import io
+import mmap
+import os
 import sys
+from collections import deque
+from itertools import islice
 from pathlib import Path
+from typing import IO, TYPE_CHECKING, Iterable, Iterator, Protocol
 
-LEGACY_INOUT_RE = re.compile(r"^\[(in|out)\s+([^\]]+)\]\s*(.*)$", re.IGNORECASE)
-TS_PREFIX_RE = re.compile(r"^\[(\d{4}-\d{2}-\d{2}T[^\]]+)\]\s*(.*)$")
-DEBUG_TAG_RE = re.compile(r"^\[(DEBUG [^\]]+)\]\s*(.*)$")
+# parse_line is re-exported so `debug.parse_line` keeps working.
+from debug_core import (
+    ARRAY_SEP,
+    array_items,
+    iter_entries,
+    iter_lines,
+    ndjson_items,
+    parse_chunk,
+    parse_line,
+)
 
+if TYPE_CHECKING:
+    import queue
+    from concurrent.futures import Future
 
-def parse_line(line: str):
-    line = line.rstrip("\n")
-    if not line.strip():
-        return None
-    raw = line
-
-    # 1) Timestamped lines: [ISO] <rest>
-    m_ts = TS_PREFIX_RE.match(line)
-    if m_ts:
-        ts, rest = m_ts.groups()
-        # 1a) Timestamped DEBUG-tagged lines: [DEBUG ...] payload
-        m_dbg = DEBUG_TAG_RE.match(rest)
-        if m_dbg:
-            tag, payload = m_dbg.groups()
-            tag_lower = tag.lower()
-            entry = {
-                "type": "debug",
-                "time": ts,
-                "header": f"[{tag}]",
-                "data": None,
-                "raw": raw,
-            }
-            parsed = _parse_json(payload)
-            entry["data"] = parsed
-
-            # Specialize known tags
-            if tag_lower == "debug stdin":
-                entry["type"] = "stdin"
-            elif tag_lower == "debug stdout":
-                entry["type"] = "stdout"
-            elif tag_lower == "debug socket:send":
-                entry["type"] = "socket_send"
-                if isinstance(parsed, dict):
-                    entry["event"] = parsed.get("event")
-                    entry["payload"] = parsed.get("payload")
-            elif tag_lower == "debug socket.recv":
-                entry["type"] = "socket_recv"
-                if isinstance(parsed, dict):
-                    entry["event"] = parsed.get("event")
-                    entry["payload"] = parsed.get("payload")
-            return entry
-
-        # 1b) Other timestamped lines: treat as generic log
-        return {
-            "type": "log",
-            "time": ts,
-            "header": None,
-            "message": rest.strip(),
-            "raw": raw,
-        }
-
-    # 2) Non-timestamped DEBUG-tagged lines (older runs)
-    m_dbg = DEBUG_TAG_RE.match(line)
-    if m_dbg:
-        tag, payload = m_dbg.groups()
-        tag_lower = tag.lower()
-        entry = {
-            "type": "debug",
-            "time": None,
-            "header": f"[{tag}]",
-            "data": _parse_json(payload),
-            "raw": raw,
-        }
-        if tag_lower == "debug stdin":
-            entry["type"] = "stdin"
-        elif tag_lower == "debug stdout":
-            entry["type"] = "stdout"
-        elif tag_lower == "debug socket:send":
-            entry["type"] = "socket_send"
-            if isinstance(entry["data"], dict):
-                entry["event"] = entry["data"].get("event")
-                entry["payload"] = entry["data"].get("payload")
-        elif tag_lower == "debug socket.recv":
-            entry["type"] = "socket_recv"
-            if isinstance(entry["data"], dict):
-                entry["event"] = entry["data"].get("event")
-                entry["payload"] = entry["data"].get("payload")
-        return entry
-
-    # 3) Legacy [in/out time] payload lines
-    m_legacy = LEGACY_INOUT_RE.match(line)
-    if m_legacy:
-        direction, when, payload = m_legacy.groups()
-        data = _parse_json(payload)
-        typ = "stdin" if direction.lower() == "in" else "stdout"
-        return {
-            "type": typ,
-            "time": when.strip(),
-            "header": f"[{direction} {when}]",
-            "data": data,
-            "raw": raw,
-        }
-
-    # 4) Fallback: raw message
-    return {
-        "type": "raw",
-        "time": None,
-        "header": None,
-        "data": line.strip(),
-        "raw": raw,
-    }
-
-
-def _parse_json(s: str):
-    s = s.strip()
-    if not s:
+# Writes are coalesced into chunks of this size before reaching the kernel.
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Upper bound on the input bytes handed to one --jobs worker task.
+PARALLEL_CHUNK_SIZE = 8 << 20
+
+
+class _ByteSink(Protocol):
+    def write(self, b: bytes | bytearray, /) -> object: ...
+
+    def close(self) -> None: ...
+
+
+def _write_ndjson(out_fh: _ByteSink, items: Iterable[bytes]) -> None:
+    for item in items:
+        out_fh.write(item)
+
+
+def _write_array(out_fh: _ByteSink, items: Iterable[bytes]) -> None:
+    # An item is one array element or several already joined by ARRAY_SEP.
+    sep = b"[\n  "
+    for item in items:
+        out_fh.write(sep)
+        out_fh.write(item)
+        sep = ARRAY_SEP
+    out_fh.write(b"[]" if sep == b"[\n  " else b"\n]")
+
+
+def _chunk_bounds(mm: mmap.mmap, step: int) -> list[tuple[int, int]]:
+    # Byte ranges of roughly `step` bytes, each ending just after a newline.
+    size = len(mm)
+    bounds = []
+    pos = 0
+    while pos < size:
+        nl = mm.find(b"\n", pos + step)
+        end = size if nl < 0 else nl + 1
+        bounds.append((pos, end))
+        pos = end
+    return bounds
+
+
+def _parallel_items(path: str, f: IO[bytes], jobs: int, ndjson: bool) -> Iterator[bytes] | None:
+    """Split the input into newline-aligned chunks for a process pool.
+
+    Returns None when f cannot be memory-mapped, so the caller can fall back
+    to the sequential path.
+    """
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
         return None
+    with mm:
+        step = max(1, min(PARALLEL_CHUNK_SIZE, -(-len(mm) // jobs)))
+        tasks = [(path, start, end, ndjson) for start, end in _chunk_bounds(mm, step)]
+    return _run_pool(tasks, jobs)
+
+
+def _run_pool(tasks: list[tuple[str, int, int, bool]], jobs: int) -> Iterator[bytes]:
+    # Keep at most 2*jobs tasks in flight: map() would submit them all up
+    # front and hold every finished chunk in memory until it is written.
+    # Results are taken oldest first, so output order matches the input.
+    from concurrent.futures import ProcessPoolExecutor
+
+    pending: deque[Future[bytes]] = deque()
+    todo = iter(tasks)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for task in islice(todo, 2 * jobs):
+            pending.append(executor.submit(parse_chunk, task))
+        while pending:
+            chunk = pending.popleft().result()
+            following = next(todo, None)
+            if following is not None:
+                pending.append(executor.submit(parse_chunk, following))
+            if chunk:
+                yield chunk
+
+
+class _ThreadedWriter:
+    """Write-behind wrapper: full chunks are handed to a background thread so
+    encoding the next entries overlaps with the write(2) of earlier ones."""
+
+    def __init__(self, raw: _ByteSink, chunk_size: int = OUTPUT_BUFFER_SIZE, depth: int = 8) -> None:
+        import queue
+        import threading
+
+        self._raw = raw
+        self._chunk_size = chunk_size
+        self._buf = bytearray()
+        self._queue: queue.Queue[bytearray | None] = queue.Queue(maxsize=depth)
+        self._error: BaseException | None = None
+        self._worker = threading.Thread(target=self._drain, daemon=True)
+        self._worker.start()
+
+    def _drain(self) -> None:
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            # After a failure keep draining so the producer never blocks on
+            # put(); any exception is stored and re-raised on the main thread.
+            if self._error is None:
+                try:
+                    self._raw.write(chunk)
+                except BaseException as exc:
+                    self._error = exc
+
+    def write(self, b: bytes | bytearray) -> None:
+        if self._error is not None:
+            raise self._error
+        self._buf += b
+        if len(self._buf) >= self._chunk_size:
+            self._queue.put(self._buf)
+            self._buf = bytearray()
+
+    def close(self) -> None:
+        if self._buf:
+            self._queue.put(self._buf)
+            self._buf = bytearray()
+        self._queue.put(None)
+        self._worker.join()
+        try:
+            if self._error is not None:
+                raise self._error
+        finally:
+            self._raw.close()
+
+
+class _StdoutAdapter:
+    """Byte sink for a sys.stdout without a file descriptor (redirect_stdout,
+    pytest capture, embedding): bytes go to its .buffer when it has one,
+    otherwise they are decoded and written as text. close() only flushes."""
+
+    def __init__(self, stream: IO[str]) -> None:
+        self._stream = stream
+        self._buffer: IO[bytes] | None = getattr(stream, "buffer", None)
+
+    def write(self, b: bytes | bytearray) -> None:
+        # Every write is whole encoded items, so each decodes on its own.
+        if self._buffer is not None:
+            self._buffer.write(b)
+        else:
+            self._stream.write(b.decode("utf-8"))
+
+    def close(self) -> None:
+        if self._buffer is not None:
+            self._buffer.flush()
+        self._stream.flush()
+
+
+def _open_stdout() -> _ByteSink:
+    sys.stdout.flush()
     try:
-        return json.loads(s)
-    except Exception:
-        # If it isn't valid JSON, return the raw string for visibility
-        return s
+        fd = sys.stdout.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return _StdoutAdapter(sys.stdout)
+    # Reopen the stdout fd with a large buffer; closefd=False leaves the
+    # descriptor itself open when the returned file is closed.
+    return open(fd, "wb", buffering=OUTPUT_BUFFER_SIZE, closefd=False)
 
 
-def main(argv=None):
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+
     p = argparse.ArgumentParser(description="Pretty-print entries from debug.log")
     p.add_argument("-i", "--input", default="debug.log", help="log file path (default: debug.log)")
     p.add_argument("-o", "--output", default=None, help="output file path (default: stdout)")
     p.add_argument("--ndjson", action="store_true", help="emit newline-delimited JSON entries instead of an array")
+    p.add_argument(
+        "--async-write",
+        action="store_true",
+        help="write output from a background thread so disk I/O overlaps with parsing",
+    )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="parse with N worker processes; 0 uses every CPU (default: 1)",
+    )
     args = p.parse_args(argv)
+    if args.jobs < 0:
+        p.error("--jobs must be 0 or a positive integer")
+    jobs = args.jobs or os.cpu_count() or 1
 
     in_path = Path(args.input)
     try:
-        with in_path.open("r", encoding="utf-8") as f:
-            entries = []
-            for idx, line in enumerate(f, 1):
-                parsed = parse_line(line)
-                if parsed is None:
-                    continue
-                entries.append(parsed)
+        f = in_path.open("rb")
     except FileNotFoundError:
         print(f"error: input file not found: {in_path}", file=sys.stderr)
         return 1
 
-    if args.output:
-        out_fh = Path(args.output).open("w", encoding="utf-8")
-        should_close = True
-    else:
-        out_fh = sys.stdout
-        should_close = False
-
-    try:
-        if args.ndjson:
-            for entry in entries:
-                json.dump(entry, out_fh, ensure_ascii=False)
-                out_fh.write("\n")
+    with f:
+        out_fh: _ByteSink
+        if args.output:
+            out_fh = Path(args.output).open("wb", buffering=OUTPUT_BUFFER_SIZE)
         else:
-            json.dump(entries, out_fh, ensure_ascii=False, indent=2)
-            if out_fh is sys.stdout:
-                out_fh.write("\n")
-    finally:
-        if should_close:
+            out_fh = _open_stdout()
+        if args.async_write:
+            out_fh = _ThreadedWriter(out_fh)
+
+        try:
+            items = _parallel_items(str(in_path), f, jobs, args.ndjson) if jobs > 1 else None
+            if items is None:
+                entries = iter_entries(iter_lines(f))
+                items = ndjson_items(entries) if args.ndjson else array_items(entries)
+            if args.ndjson:
+                _write_ndjson(out_fh, items)
+            else:
+                _write_array(out_fh, items)
+                if not args.output:
+                    out_fh.write(b"\n")
+        finally:
             out_fh.close()
 
     return 0
@@ -0,0 +1,395 @@
+"""
+Line parsing for debug.py.
+
+Kept apart from the CLI so that --jobs worker processes import only what
+parsing needs: no argparse, output plumbing or thread machinery.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import mmap
+import sys
+from functools import lru_cache
+from typing import IO, Any, Callable, Dict, Iterable, Iterator
+
+try:
+    import re2 as re  # type: ignore[import-not-found]
+except ImportError:  # optional: stdlib re is used when google-re2 is absent
+    import re
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used when orjson is absent
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import simdjson
+except ImportError:  # optional: decodes payloads when orjson is absent
+    simdjson = None  # type: ignore[assignment]
+
+# simdjson reuses one parser's buffers across documents.
+_SIMDJSON_PARSER: Any = simdjson.Parser() if simdjson is not None else None
+
+
+def _simdjson_loads(s: str) -> Any:
+    return _SIMDJSON_PARSER.parse(s.encode("utf-8"), recursive=True)
+
+
+# NaN, Infinity or an out-of-range float from the stdlib decoder. orjson
+# would encode these as null but refuses float subclasses, so _dumps falls
+# back to the stdlib, which writes NaN/Infinity as before. Built with type()
+# because mypyc cannot compile a class statement that subclasses float.
+_NonFiniteFloat: Callable[[str | float], float] = type("_NonFiniteFloat", (float,), {})
+
+
+def _parse_float(text: str) -> float:
+    value = float(text)
+    return value if math.isfinite(value) else _NonFiniteFloat(value)
+
+
+def _stdlib_loads(s: str) -> Any:
+    return json.loads(s, parse_float=_parse_float, parse_constant=_NonFiniteFloat)
+
+
+_loads: Callable[[str], Any]
+if orjson is not None:
+    _loads = orjson.loads
+elif simdjson is not None:
+    _loads = _simdjson_loads
+else:
+    _loads = json.loads
+
+
+def _dumps(obj: Any, indent: bool = False, newline: bool = False) -> bytes:
+    separators: tuple[str, str] | None = None
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        if newline:
+            # Lets orjson write the terminator into its own buffer instead of
+            # copying the encoded entry into a new bytes object.
+            option |= orjson.OPT_APPEND_NEWLINE
+        try:
+            return orjson.dumps(obj, option=option)
+        except orjson.JSONEncodeError:
+            # Nested past 255 levels: encode with the stdlib instead, using
+            # orjson's separators so the layout stays the same.
+            separators = (",", ": ") if indent else (",", ":")
+    out = json.dumps(obj, ensure_ascii=False, indent=2 if indent else None, separators=separators).encode("utf-8")
+    return out + b"\n" if newline else out
+
+
+# First characters a JSON document can start with, including the NaN and
+# Infinity that the stdlib decoder (every backend's fallback) accepts.
+_JSON_STARTS = frozenset('{["-0123456789tfnNI')
+
+# Last character required after each bracketing first character.
+_JSON_CLOSERS = {"{": "}", "[": "]", '"': '"'}
+
+# A document with at most this many '[' and '{' cannot be nested deep enough
+# to exhaust the stdlib encoder's recursion limit.
+_SAFE_NESTING = sys.getrecursionlimit() // 2
+
+# orjson decodes ints outside the 64-bit range as floats, losing digits.
+# Every such int has at least 19 digits, so payloads with a run that long
+# are decoded with the stdlib, which keeps ints exact. Mapping every digit
+# to b"0" turns the search into one substring test.
+_DIGITS_TO_ZERO = bytes.maketrans(b"123456789", b"000000000")
+_LONG_DIGITS = b"0" * 19
+
+# orjson's decoder recurses on the C stack with no depth limit (tens of
+# thousands of levels overflow it), so documents with more '[' and '{' than
+# this are decoded with the stdlib, which raises RecursionError instead.
+_ORJSON_SAFE_NESTING = 10000
+
+# A parsed log line, ready to be serialized.
+Entry = Dict[str, Any]
+
+# Separator between elements of the pretty-printed output array.
+ARRAY_SEP = b",\n  "
+
+# One pass classifies every line format:
+#   [in|out <time>] <payload>                    (legacy)
+#   [<ISO>] [DEBUG <tag>] <payload>              (timestamped debug)
+#   [DEBUG <tag>] <payload>                      (older, untimestamped debug)
+#   [<ISO>] <rest>                               (generic log)
+#   <rest>                                       (raw)
+# The leading characters of the three bracketed forms are disjoint, so
+# alternation order does not change which form a line is classified as.
+# The pattern uses no backreferences or lookaround so it compiles under re2.
+LINE_RE = re.compile(
+    r"^(?:"
+    r"\[(?P<dir>(?i:in|out))\s+(?P<when>[^\]]+)\]\s*(?P<legacy>.*)"
+    r"|(?:\[(?P<ts>\d{4}-\d{2}-\d{2}T[^\]]+)\]\s*)?"
+    r"(?:\[(?P<tag>DEBUG [^\]]+)\]\s*(?P<payload>.*)|(?P<rest>.*))"
+    r")$"
+)
+
+# Second characters that can start a bracketed form matched by LINE_RE
+# (besides a timestamp digit, which is checked with str.isdigit).
+_BRACKET_STARTS = frozenset("DiIoO")
+
+# Entry type for each known DEBUG tag (lower-cased). A single hash lookup
+# costs the same whichever tag dominates the log, so no ordering is needed.
+_TAG_TYPES = {
+    "debug stdin": "stdin",
+    "debug stdout": "stdout",
+    "debug socket:send": "socket_send",
+    "debug socket.recv": "socket_recv",
+}
+
+# Entry types whose payload is a socket {"event": ..., "payload": ...} envelope.
+_SOCKET_ENTRY_TYPES = frozenset({"socket_send", "socket_recv"})
+
+
+def parse_line(line: str) -> Entry | None:
+    """Parse one log line, given without its line terminator."""
+    if not line or line.isspace():
+        return None
+    raw = line
+
+    # Cheap prefix screen: lines that cannot match any bracketed form are raw
+    # and never reach the regex engine.
+    second = line[1:2]
+    if line[0] != "[" or not (second in _BRACKET_STARTS or second.isdigit()):
+        return _raw_entry(line)
+
+    # Fast paths, equivalent to LINE_RE but using only slices and compares:
+    # the server writes [YYYY-MM-DDTHH:MM:SS.mmmZ] timestamps, whose fields
+    # sit at fixed offsets, and an untimestamped line starting "[D" can only
+    # be DEBUG-tagged or raw. (str.isdecimal is exactly what re's \d matches.)
+    # `body` is the DEBUG payload when `tag` is set, otherwise the rest of
+    # the line after any timestamp.
+    tag: str | None
+    if (
+        line[24:26] == "Z]"
+        and line[11] == "T"
+        and line[5] == "-"
+        and line[8] == "-"
+        and line[1:5].isdecimal()
+        and line[6:8].isdecimal()
+        and line[9:11].isdecimal()
+        and "]" not in line[12:24]
+    ):
+        ts = line[1:25]
+        tag, body = _split_tag(line[26:].lstrip())
+    elif second == "D":
+        ts = None
+        tag, body = _split_tag(line)
+    else:
+        m = LINE_RE.match(line)
+        direction = m.group("dir")
+
+        # 1) Legacy [in/out time] payload lines
+        if direction is not None:
+            when = m.group("when")
+            typ = "stdin" if direction.lower() == "in" else "stdout"
+            return {
+                "type": typ,
+                "time": when.strip(),
+                "header": f"[{direction} {when}]",
+                "data": _parse_json(m.group("legacy")),
+                "raw": raw,
+            }
+        ts, tag = m.group("ts", "tag")
+        body = m.group("rest") if tag is None else m.group("payload")
+
+    # 2) DEBUG-tagged lines, with or without a timestamp prefix
+    if tag is not None:
+        typ, header, is_socket = _classify_tag(tag)
+        parsed = _parse_json(body)
+
+        # Each entry is built in a single dict display with its final keys,
+        # rather than grown (and resized) key by key.
+        if is_socket and isinstance(parsed, dict):
+            return {
+                "type": typ,
+                "time": ts,
+                "header": header,
+                "data": parsed,
+                "raw": raw,
+                "event": parsed.get("event"),
+                "payload": parsed.get("payload"),
+            }
+        return {
+            "type": typ,
+            "time": ts,
+            "header": header,
+            "data": parsed,
+            "raw": raw,
+        }
+
+    # 3) Other timestamped lines: treat as generic log
+    if ts is not None:
+        return {
+            "type": "log",
+            "time": ts,
+            "header": None,
+            "message": body.strip(),
+            "raw": raw,
+        }
+
+    # 4) Fallback: raw message
+    return _raw_entry(line)
+
+
+def _split_tag(s: str) -> tuple[str | None, str]:
+    """Split "[DEBUG <tag>] <payload>" into (tag, payload), or return
+    (None, s) when s does not start with a DEBUG tag."""
+    if s.startswith("[DEBUG "):
+        close = s.find("]", 7)
+        if close > 7:
+            return s[1:close], s[close + 1 :]
+    return None, s
+
+
+@lru_cache(maxsize=64)
+def _classify_tag(tag: str) -> tuple[str, str, bool]:
+    """Return (entry type, header, payload is a socket envelope) for a tag.
+
+    Logs carry only a handful of distinct tags, so lower-casing and lookup
+    happen once per tag rather than once per line, and every entry with a
+    given tag shares one header string. (Entry keys and type names are
+    identifier-like literals, which CPython already interns.)
+    """
+    typ = _TAG_TYPES.get(tag.lower(), "debug")
+    return typ, f"[{tag}]", typ in _SOCKET_ENTRY_TYPES
+
+
+def _raw_entry(line: str) -> Entry:
+    return {
+        "type": "raw",
+        "time": None,
+        "header": None,
+        "data": line.strip(),
+        "raw": line,
+    }
+
+
+def _parse_json(s: str) -> Any:
+    s = s.strip()
+    if not s:
+        return None
+    # Structural sniff: text that cannot be a JSON document skips the
+    # decoder (and its exception) entirely. Only checks that hold for every
+    # valid document are made; brace counting would misfire on braces
+    # inside strings.
+    first = s[0]
+    if first not in _JSON_STARTS:
+        return s
+    closer = _JSON_CLOSERS.get(first)
+    if closer is not None and (s[-1] != closer or len(s) == 1):
+        return s
+    brackets = s.count("[") + s.count("{") if len(s) > 2 * _SAFE_NESTING else 0
+    loads = _loads
+    if orjson is not None and (
+        brackets > _ORJSON_SAFE_NESTING
+        or (len(s) >= len(_LONG_DIGITS) and _LONG_DIGITS in s.encode("utf-8").translate(_DIGITS_TO_ZERO))
+    ):
+        loads = _stdlib_loads
+    try:
+        value = loads(s)
+    except (ValueError, RuntimeError):
+        # ValueError is every backend's decode error (orjson.JSONDecodeError
+        # subclasses json.JSONDecodeError); too-deep nesting raises
+        # RecursionError (stdlib) or RuntimeError (simdjson).
+        if loads is json.loads or loads is _stdlib_loads:
+            # If it isn't valid JSON, return the raw string for visibility
+            return s
+        # orjson and simdjson also reject NaN, Infinity and out-of-range
+        # floats, and simdjson ints past 64 bits; the stdlib accepts them.
+        try:
+            value = _stdlib_loads(s)
+        except (ValueError, RecursionError):
+            return s
+    if brackets > _SAFE_NESTING:
+        # orjson and simdjson decode documents nested deeper than the stdlib
+        # encoder (which _dumps uses past 255 levels) can write back out. The
+        # stdlib decoder rejects those too, so they stay raw strings.
+        try:
+            _dumps([value])
+        except RecursionError:
+            return s
+    return value
+
+
+def _decode_line(seg: bytes) -> str:
+    # Blank lines are dropped by parse_line, so skip decoding them.
+    if seg.isspace():
+        return ""
+    return seg.decode("utf-8", "replace")
+
+
+def _split_cr(seg: bytes) -> Iterator[str]:
+    # seg is one b"\n"-terminated segment containing \r. Like universal
+    # newlines, a trailing \r belongs to a \r\n terminator and a lone \r
+    # ends a line of its own.
+    if seg.endswith(b"\r"):
+        seg = seg[:-1]
+    for part in seg.split(b"\r"):
+        yield _decode_line(part)
+
+
+def _iter_mapped_lines(mm: mmap.mmap, start: int, end: int) -> Iterator[str]:
+    while start < end:
+        nl = mm.find(b"\n", start, end)
+        if nl < 0:
+            nl = end
+        seg = mm[start:nl]
+        if b"\r" in seg:
+            yield from _split_cr(seg)
+        else:
+            yield _decode_line(seg)
+        start = nl + 1
+
+
+def iter_lines(f: IO[bytes]) -> Iterator[str]:
+    """Yield the decoded lines of f without their line terminators.
+
+    Regular files are memory-mapped and split with bytes.find (memchr);
+    anything that cannot be mapped (pipes, empty files) is read line by line.
+    """
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        for seg in f:
+            seg = seg.rstrip(b"\n")
+            if b"\r" in seg:
+                yield from _split_cr(seg)
+            else:
+                yield _decode_line(seg)
+        return
+
+    with mm:
+        yield from _iter_mapped_lines(mm, 0, len(mm))
+
+
+def iter_entries(lines: Iterable[str]) -> Iterator[Entry]:
+    for line in lines:
+        entry = parse_line(line)
+        if entry is not None:
+            yield entry
+
+
+def ndjson_items(entries: Iterable[Entry]) -> Iterator[bytes]:
+    for entry in entries:
+        yield _dumps(entry, newline=True)
+
+
+def array_items(entries: Iterable[Entry]) -> Iterator[bytes]:
+    # Each entry is dumped on its own and shifted one level in, matching the
+    # layout of the whole list dumped with indent=2. JSON strings never
+    # contain a literal newline, so replacing b"\n" only touches layout.
+    for entry in entries:
+        yield _dumps(entry, indent=True).replace(b"\n", b"\n  ")
+
+
+def parse_chunk(task: tuple[str, int, int, bool]) -> bytes:
+    """Process-pool worker: parse one byte range and return its encoded items."""
+    path, start, end, ndjson = task
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        entries = iter_entries(_iter_mapped_lines(mm, start, end))
+        if ndjson:
+            return b"".join(ndjson_items(entries))
+        return ARRAY_SEP.join(array_items(entries))